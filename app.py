@@ -1,11 +1,18 @@
-from fastapi import FastAPI, HTTPException, Depends, Query, Path, Header, Body
+from fastapi import FastAPI, HTTPException, Depends, Query, Path, Header, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from sqlalchemy import select, update, delete, bindparam, event, func, text, Column, Index, Integer, String, Text, DateTime
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, Field
+from typing import Optional
 from datetime import datetime
+import hashlib
+import msgspec
 import os
 
 # Create FastAPI app
@@ -14,43 +21,126 @@ app = FastAPI(
     description="A comprehensive API for managing users with full CRUD operations",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=ORJSONResponse
 )
 
-# Add CORS middleware
+# Add CORS middleware. Wildcard origins plus allow_credentials=True is
+# invalid per the CORS spec, so starlette had to reflect the request Origin
+# on every response; without credentials it serves a static "*" header
+# instead. Nothing here relies on cookies (auth is via x-api-key).
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Database setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Database setup; aiosqlite runs queries off the event loop so handlers no
+# longer block each other on synchronous driver calls
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./users.db"
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+)
+
+# Tune SQLite for the many small transactions this API issues: WAL lets
+# readers proceed while a writer commits, and synchronous=NORMAL avoids an
+# fsync per commit (still durable under application crashes in WAL mode)
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-64000")
+    cursor.close()
+
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Database model
 class UserDB(Base):
     __tablename__ = "users"
-    
+    # Composite index serving the combined name + age filters in get_users;
+    # it also subsumes a single-column name index
+    __table_args__ = (
+        Index("ix_users_name_age", "name", "age"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String)
     email = Column(String, unique=True, index=True)
     age = Column(Integer)
     bio = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+
+# FTS5 index over name/email backing the search endpoint, kept in sync with
+# the users table by triggers; the final 'rebuild' backfills existing rows
+USERS_FTS_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS users_fts
+       USING fts5(name, email, content='users', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+         INSERT INTO users_fts(rowid, name, email)
+         VALUES (new.id, new.name, new.email);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+         INSERT INTO users_fts(users_fts, rowid, name, email)
+         VALUES ('delete', old.id, old.name, old.email);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE ON users BEGIN
+         INSERT INTO users_fts(users_fts, rowid, name, email)
+         VALUES ('delete', old.id, old.name, old.email);
+         INSERT INTO users_fts(rowid, name, email)
+         VALUES (new.id, new.name, new.email);
+       END""",
+    """INSERT INTO users_fts(users_fts) VALUES ('rebuild')""",
+)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Monotonic write-version for the users table, bumped by triggers on every
+# insert/update/delete; the list ETag derives from it, so cached reads
+# invalidate deterministically across connections and workers
+USERS_VERSION_DDL = (
+    """CREATE TABLE IF NOT EXISTS users_version
+       (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)""",
+    """INSERT OR IGNORE INTO users_version (id, version) VALUES (1, 0)""",
+    """CREATE TRIGGER IF NOT EXISTS users_version_ai AFTER INSERT ON users
+       BEGIN UPDATE users_version SET version = version + 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS users_version_au AFTER UPDATE ON users
+       BEGIN UPDATE users_version SET version = version + 1; END""",
+    """CREATE TRIGGER IF NOT EXISTS users_version_ad AFTER DELETE ON users
+       BEGIN UPDATE users_version SET version = version + 1; END""",
+)
+
+# Create tables (the async engine can only issue DDL from within the loop).
+# Every uvicorn worker runs this hook concurrently, and create_all's
+# check-then-create can lose the race on a fresh database; the loser retries
+# once, at which point the winner's tables exist and everything no-ops
+# (the raw DDL below is IF NOT EXISTS / OR IGNORE and cannot race)
+@app.on_event("startup")
+async def create_tables():
+    for attempt in (1, 2):
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+                for ddl in USERS_FTS_DDL + USERS_VERSION_DDL:
+                    await conn.execute(text(ddl))
+            break
+        except OperationalError:
+            if attempt == 2:
+                raise
 
-# Pydantic models for request/response
+# Pydantic models for request validation
 class UserBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100, description="User's full name")
-    email: str = Field(..., description="User's email address")
+    email: EmailStr = Field(..., description="User's email address")
     age: int = Field(..., ge=0, le=150, description="User's age")
     bio: Optional[str] = Field(None, max_length=500, description="User's biography")
 
@@ -59,29 +149,58 @@ class UserCreate(UserBase):
 
 class UserUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=100, description="User's full name")
-    email: Optional[str] = Field(None, description="User's email address")
+    email: Optional[EmailStr] = Field(None, description="User's email address")
     age: Optional[int] = Field(None, ge=0, le=150, description="User's age")
     bio: Optional[str] = Field(None, max_length=500, description="User's biography")
 
-class UserResponse(UserBase):
+# Dependency to get database session
+async def get_db():
+    async with SessionLocal() as db:
+        yield db
+
+# Columns fetched by the list endpoints; selecting plain tuples instead of
+# full UserDB entities skips the ORM identity map and per-row attribute
+# instrumentation
+USER_COLUMNS = (
+    UserDB.id, UserDB.name, UserDB.email, UserDB.age,
+    UserDB.bio, UserDB.created_at, UserDB.updated_at
+)
+
+# Prepared statements for the hot single-row lookups; keeping these
+# referentially stable means SQLAlchemy compiles each one exactly once
+STMT_USER_BY_ID = select(UserDB).where(UserDB.id == bindparam("uid"))
+STMT_DELETE_USER = delete(UserDB).where(UserDB.id == bindparam("uid"))
+STMT_USERS_VERSION = text("SELECT version FROM users_version")
+STMT_SEARCH_USERS = text(
+    "SELECT u.id, u.name, u.email, u.age, u.bio, u.created_at, u.updated_at "
+    "FROM users AS u JOIN users_fts AS f ON u.id = f.rowid "
+    "WHERE users_fts MATCH :term"
+).columns(*USER_COLUMNS)
+
+# EXISTS guard used by the update endpoints: true when another user already
+# holds the given email
+def email_taken_by_other(email: str, user_id: int):
+    return select(UserDB.id).where(
+        (UserDB.email == email) & (UserDB.id != user_id)
+    ).exists()
+
+# msgspec struct used on the response path; field order
+# matches USER_COLUMNS so UserOut(*row) is plain positional assignment and
+# encoding runs entirely in msgspec's C core
+class UserOut(msgspec.Struct):
     id: int
+    name: str
+    email: str
+    age: int
+    bio: Optional[str]
     created_at: datetime
     updated_at: datetime
-    
-    class Config:
-        from_attributes = True
 
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+JSON_ENCODER = msgspec.json.Encoder()
 
-# Helper function to convert DB model to response model
-def user_db_to_response(user_db: UserDB) -> UserResponse:
-    return UserResponse(
+# Helper function to convert DB model to the response struct
+def user_db_to_out(user_db: UserDB) -> UserOut:
+    return UserOut(
         id=user_db.id,
         name=user_db.name,
         email=user_db.email,
@@ -91,6 +210,14 @@ def user_db_to_response(user_db: UserDB) -> UserResponse:
         updated_at=user_db.updated_at
     )
 
+# Helper function to serialize responses through msgspec
+def json_response(payload, status_code: int = 200) -> Response:
+    return Response(
+        JSON_ENCODER.encode(payload),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
 # API Endpoints
 
 @app.get("/", tags=["Root"])
@@ -100,10 +227,10 @@ async def root():
     """
     return {"message": "Welcome to User Management API", "docs": "/docs"}
 
-@app.post("/users", response_model=UserResponse, status_code=201, tags=["Users"])
+@app.post("/users", status_code=201, tags=["Users"])
 async def create_user(
     user: UserCreate = Body(..., description="User data to create"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_api_key: Optional[str] = Header(None, description="API Key for authentication")
 ):
     """
@@ -115,27 +242,31 @@ async def create_user(
     - **bio**: User's biography (optional)
     - **x_api_key**: API key for authentication (optional header)
     """
-    # Check if user with email already exists
-    existing_user = db.query(UserDB).filter(UserDB.email == user.email).first()
-    if existing_user:
+    # Insert in a single round-trip: the unique index on email already
+    # enforces uniqueness, so let the database decide instead of issuing a
+    # separate existence check (which was also a race condition)
+    stmt = (
+        sqlite_insert(UserDB)
+        .values(**user.model_dump(mode="python"))
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(*USER_COLUMNS)
+    )
+    row = (await db.execute(stmt)).fetchone()
+    if row is None:
         raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create new user
-    db_user = UserDB(**user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    
-    return user_db_to_response(db_user)
+    await db.commit()
+
+    return json_response(UserOut(*row), status_code=201)
 
-@app.get("/users", response_model=List[UserResponse], tags=["Users"])
+@app.get("/users", tags=["Users"])
 async def get_users(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of users to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of users to return"),
     name: Optional[str] = Query(None, description="Filter users by name (partial match)"),
     min_age: Optional[int] = Query(None, ge=0, description="Minimum age filter"),
     max_age: Optional[int] = Query(None, ge=0, description="Maximum age filter"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     authorization: Optional[str] = Header(None, description="Authorization header")
 ):
     """
@@ -148,25 +279,54 @@ async def get_users(
     - **max_age**: Filter users by maximum age
     - **authorization**: Authorization header (optional)
     """
-    query = db.query(UserDB)
-    
+    # Weak ETag over the trigger-maintained write version and the query
+    # string: the counter bumps on every committed write to users, so it is
+    # deterministic across pooled connections and worker processes, unlike
+    # timestamps (second granularity) or PRAGMA data_version (per-connection)
+    version = (await db.execute(STMT_USERS_VERSION)).scalar()
+    etag = 'W/"%s"' % hashlib.md5(
+        ("%s|%s" % (version, request.url.query)).encode()
+    ).hexdigest()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+
+    stmt = select(*USER_COLUMNS)
+
     # Apply filters
     if name:
-        query = query.filter(UserDB.name.contains(name))
+        stmt = stmt.where(UserDB.name.contains(name))
     if min_age is not None:
-        query = query.filter(UserDB.age >= min_age)
+        stmt = stmt.where(UserDB.age >= min_age)
     if max_age is not None:
-        query = query.filter(UserDB.age <= max_age)
-    
-    # Apply pagination
-    users = query.offset(skip).limit(limit).all()
-    
-    return [user_db_to_response(user) for user in users]
+        stmt = stmt.where(UserDB.age <= max_age)
 
-@app.get("/users/{user_id}", response_model=UserResponse, tags=["Users"])
+    stmt = stmt.offset(skip).limit(limit).execution_options(yield_per=100)
+
+    # Stream rows straight to the socket instead of materializing the full
+    # list and body in memory: peak usage stays flat and the first bytes
+    # flush before the last row is fetched
+    async def stream_users():
+        yield b"["
+        first = True
+        result = await db.stream(stmt)
+        async for row in result:
+            if not first:
+                yield b","
+            yield JSON_ENCODER.encode(UserOut(*row))
+            first = False
+        yield b"]"
+
+    return StreamingResponse(
+        stream_users(),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, max-age=0"}
+    )
+
+@app.get("/users/{user_id}", tags=["Users"])
 async def get_user_by_id(
+    request: Request,
     user_id: int = Path(..., gt=0, description="The ID of the user to retrieve"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_user_id: Optional[str] = Header(None, description="User ID header for tracking")
 ):
     """
@@ -175,17 +335,30 @@ async def get_user_by_id(
     - **user_id**: The ID of the user to retrieve (path parameter)
     - **x_user_id**: User ID header for tracking (optional header)
     """
-    user = db.query(UserDB).filter(UserDB.id == user_id).first()
+    result = await db.execute(STMT_USER_BY_ID, {"uid": user_id})
+    user = result.scalar_one_or_none()
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    return user_db_to_response(user)
 
-@app.put("/users/{user_id}", response_model=UserResponse, tags=["Users"])
+    # Weak ETag over the serialized row itself, so any content change
+    # invalidates it; the timestamps alone only have second granularity and
+    # would revalidate stale after two same-second writes
+    body = JSON_ENCODER.encode(user_db_to_out(user))
+    etag = 'W/"%s"' % hashlib.md5(body).hexdigest()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
+
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "private, max-age=0"}
+    )
+
+@app.put("/users/{user_id}", tags=["Users"])
 async def update_user(
     user_id: int = Path(..., gt=0, description="The ID of the user to update"),
     user: UserCreate = Body(..., description="Complete user data to update"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_api_key: Optional[str] = Header(None, description="API Key for authentication")
 ):
     """
@@ -195,31 +368,31 @@ async def update_user(
     - **user**: Complete user data (all fields required)
     - **x_api_key**: API key for authentication (optional header)
     """
-    db_user = db.query(UserDB).filter(UserDB.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if email is being changed and if it's already taken
-    if user.email != db_user.email:
-        existing_user = db.query(UserDB).filter(UserDB.email == user.email).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Update all fields
-    for field, value in user.dict().items():
-        setattr(db_user, field, value)
-    
-    db_user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_user)
-    
-    return user_db_to_response(db_user)
+    # Update in a single round-trip: the EXISTS guard rejects the write when
+    # another user already holds the new email
+    stmt = (
+        update(UserDB)
+        .where(UserDB.id == user_id)
+        .where(~email_taken_by_other(user.email, user_id))
+        .values(**user.model_dump(mode="python"))
+        .returning(*USER_COLUMNS)
+    )
+    row = (await db.execute(stmt)).fetchone()
+    if row is None:
+        # Disambiguate 404 vs 400 only on the failure path
+        result = await db.execute(STMT_USER_BY_ID, {"uid": user_id})
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await db.commit()
+
+    return json_response(UserOut(*row))
 
-@app.patch("/users/{user_id}", response_model=UserResponse, tags=["Users"])
+@app.patch("/users/{user_id}", tags=["Users"])
 async def partial_update_user(
     user_id: int = Path(..., gt=0, description="The ID of the user to partially update"),
     user: UserUpdate = Body(..., description="Partial user data to update"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_api_key: Optional[str] = Header(None, description="API Key for authentication")
 ):
     """
@@ -229,31 +402,40 @@ async def partial_update_user(
     - **user**: Partial user data (only fields to update)
     - **x_api_key**: API key for authentication (optional header)
     """
-    db_user = db.query(UserDB).filter(UserDB.id == user_id).first()
-    if db_user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Check if email is being changed and if it's already taken
-    if user.email is not None and user.email != db_user.email:
-        existing_user = db.query(UserDB).filter(UserDB.email == user.email).first()
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Update only provided fields
-    user_data = user.dict(exclude_unset=True)
-    for field, value in user_data.items():
-        setattr(db_user, field, value)
-    
-    db_user.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_user)
-    
-    return user_db_to_response(db_user)
+    user_data = user.model_dump(exclude_unset=True)
+    if not user_data:
+        # Nothing to change; just return the current row (or 404)
+        result = await db.execute(STMT_USER_BY_ID, {"uid": user_id})
+        db_user = result.scalar_one_or_none()
+        if db_user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return json_response(user_db_to_out(db_user))
+
+    # Update only provided fields in a single round-trip; the EXISTS guard
+    # rejects the write when another user already holds the new email
+    stmt = (
+        update(UserDB)
+        .where(UserDB.id == user_id)
+        .values(**user_data)
+        .returning(*USER_COLUMNS)
+    )
+    if user.email is not None:
+        stmt = stmt.where(~email_taken_by_other(user.email, user_id))
+    row = (await db.execute(stmt)).fetchone()
+    if row is None:
+        # Disambiguate 404 vs 400 only on the failure path
+        result = await db.execute(STMT_USER_BY_ID, {"uid": user_id})
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        raise HTTPException(status_code=400, detail="Email already registered")
+    await db.commit()
+
+    return json_response(UserOut(*row))
 
 @app.delete("/users/{user_id}", status_code=204, tags=["Users"])
 async def delete_user(
     user_id: int = Path(..., gt=0, description="The ID of the user to delete"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     x_api_key: Optional[str] = Header(None, description="API Key for authentication")
 ):
     """
@@ -262,19 +444,18 @@ async def delete_user(
     - **user_id**: The ID of the user to delete (path parameter)
     - **x_api_key**: API key for authentication (optional header)
     """
-    db_user = db.query(UserDB).filter(UserDB.id == user_id).first()
-    if db_user is None:
+    # One DELETE round-trip; rowcount tells existing from missing rows
+    result = await db.execute(STMT_DELETE_USER, {"uid": user_id})
+    if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    db.delete(db_user)
-    db.commit()
-    
+    await db.commit()
+
     return None
 
-@app.get("/users/search/{search_term}", response_model=List[UserResponse], tags=["Users"])
+@app.get("/users/search/{search_term}", tags=["Users"])
 async def search_users(
     search_term: str = Path(..., min_length=1, description="Search term to find users"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     content_type: Optional[str] = Header(None, description="Content type header")
 ):
     """
@@ -283,12 +464,32 @@ async def search_users(
     - **search_term**: Search term to find users (path parameter)
     - **content_type**: Content type header (optional header)
     """
-    users = db.query(UserDB).filter(
-        (UserDB.name.contains(search_term)) | (UserDB.email.contains(search_term))
-    ).all()
-    
-    return [user_db_to_response(user) for user in users]
+    # Prefix-match against the FTS5 index instead of an unindexable
+    # double LIKE '%term%' table scan; quote the term so user input is
+    # never parsed as FTS query syntax
+    term = '"%s"*' % search_term.replace('"', '""')
+    rows = (await db.execute(STMT_SEARCH_USERS, {"term": term})).all()
+
+    # Building and encoding a big result list inline would stall the event
+    # loop for every other request; hand large batches to the threadpool
+    if len(rows) > 200:
+        body = await run_in_threadpool(
+            lambda: JSON_ENCODER.encode([UserOut(*row) for row in rows])
+        )
+        return Response(body, media_type="application/json")
+
+    return json_response([UserOut(*row) for row in rows])
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # Import string (not the app object) so uvicorn can spawn multiple
+    # workers; uvloop and httptools come with uvicorn[standard]
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=min(8, (os.cpu_count() or 1) * 2 + 1),
+        loop="uvloop",
+        http="httptools",
+        access_log=False
+    ) 
\ No newline at end of file
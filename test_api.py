@@ -5,6 +5,7 @@ This script demonstrates all the API endpoints with example requests.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
 
@@ -29,9 +30,14 @@ def test_api():
     print("🚀 Starting API Tests...")
     print(f"API Base URL: {BASE_URL}")
     
+    # One pooled session reuses the TCP connection across every call below
+    # instead of paying a fresh handshake (and a TIME_WAIT socket) per request
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=10))
+    
     # Test 1: Root endpoint
     print("\n1️⃣ Testing Root Endpoint")
-    response = requests.get(f"{BASE_URL}/")
+    response = session.get(f"{BASE_URL}/")
     print_response(response, "GET / - Root Endpoint")
     
     # Test 2: Create users
@@ -61,7 +67,7 @@ def test_api():
     created_users = []
     for i, user_data in enumerate(users_data, 1):
         print(f"\nCreating user {i}: {user_data['name']}")
-        response = requests.post(
+        response = session.post(
             f"{BASE_URL}/users",
             json=user_data,
             headers={"x-api-key": "test-key-123"}
@@ -72,12 +78,12 @@ def test_api():
     
     # Test 3: Get all users
     print("\n3️⃣ Testing Get All Users")
-    response = requests.get(f"{BASE_URL}/users")
+    response = session.get(f"{BASE_URL}/users")
     print_response(response, "GET /users - Get All Users")
     
     # Test 4: Get users with query parameters
     print("\n4️⃣ Testing Get Users with Query Parameters")
-    response = requests.get(
+    response = session.get(
         f"{BASE_URL}/users",
         params={
             "skip": 0,
@@ -93,7 +99,7 @@ def test_api():
     if created_users:
         print("\n5️⃣ Testing Get User by ID")
         user_id = created_users[0]["id"]
-        response = requests.get(
+        response = session.get(
             f"{BASE_URL}/users/{user_id}",
             headers={"x-user-id": "test-user-123"}
         )
@@ -109,7 +115,7 @@ def test_api():
             "age": 31,
             "bio": "Senior Software Developer"
         }
-        response = requests.put(
+        response = session.put(
             f"{BASE_URL}/users/{user_id}",
             json=update_data,
             headers={"x-api-key": "test-key-123"}
@@ -124,7 +130,7 @@ def test_api():
             "age": 32,
             "bio": "Lead Developer"
         }
-        response = requests.patch(
+        response = session.patch(
             f"{BASE_URL}/users/{user_id}",
             json=patch_data,
             headers={"x-api-key": "test-key-123"}
@@ -133,7 +139,7 @@ def test_api():
     
     # Test 8: Search users
     print("\n8️⃣ Testing Search Users")
-    response = requests.get(
+    response = session.get(
         f"{BASE_URL}/users/search/john",
         headers={"content-type": "application/json"}
     )
@@ -143,7 +149,7 @@ def test_api():
     print("\n9️⃣ Testing Error Handling")
     
     # Test invalid user ID
-    response = requests.get(f"{BASE_URL}/users/999")
+    response = session.get(f"{BASE_URL}/users/999")
     print_response(response, "GET /users/999 - Non-existent User")
     
     # Test duplicate email
@@ -154,7 +160,7 @@ def test_api():
             "age": 40,
             "bio": "This should fail"
         }
-        response = requests.post(f"{BASE_URL}/users", json=duplicate_user)
+        response = session.post(f"{BASE_URL}/users", json=duplicate_user)
         print_response(response, "POST /users - Duplicate Email")
     
     # Test invalid data
@@ -164,21 +170,21 @@ def test_api():
         "age": -5,  # Negative age
         "bio": "A" * 600  # Too long bio
     }
-    response = requests.post(f"{BASE_URL}/users", json=invalid_user)
+    response = session.post(f"{BASE_URL}/users", json=invalid_user)
     print_response(response, "POST /users - Invalid Data")
     
     # Test 10: Delete user
     if created_users:
         print("\n🔟 Testing Delete User")
         user_id = created_users[-1]["id"]  # Delete the last created user
-        response = requests.delete(
+        response = session.delete(
             f"{BASE_URL}/users/{user_id}",
             headers={"x-api-key": "test-key-123"}
         )
         print_response(response, f"DELETE /users/{user_id} - Delete User")
         
         # Verify user is deleted
-        response = requests.get(f"{BASE_URL}/users/{user_id}")
+        response = session.get(f"{BASE_URL}/users/{user_id}")
         print_response(response, f"GET /users/{user_id} - Verify Deletion")
     
     print("\n✅ API Testing Complete!")